@@ -1,6 +1,9 @@
+import numpy as np
 import pygame
 import random
 import time
+import weakref
+from collections import OrderedDict
 
 # Default dimensions of the game window
 SCR_WIDTH = 800
@@ -27,6 +30,13 @@ SGL_PTS = 100
 DBL_PTS = 300
 TRP_PTS = 500
 TTS_PTS = 800
+# Points awarded indexed by the number of lines cleared
+LINE_PTS = [0, SGL_PTS, DBL_PTS, TRP_PTS, TTS_PTS]
+
+# Maximum number of board states kept by the lookahead solver
+TT_SIZE = 200000
+# Bitmask of a filled row in the lookahead solver
+FULL_ROW = (1 << 10) - 1
 
 # Tetris pieces represented as lists of 2D arrays with rotations
 S = [['.....',
@@ -145,6 +155,18 @@ shape_colours = [
     (255, 12, 255)
 ]
 
+# Locked tiles stored as colour indices, where 0 is an empty tile and n is 
+# the colour of shapes[n - 1]. Updated in place as pieces lock and lines clear.
+board = np.zeros((20, 10), dtype=np.uint8)
+# Read-only view of the board handed out to observers.
+board_view = board.view()
+board_view.flags.writeable = False
+# Buffers holding downsampled frames of the playable area keyed by step for
+# each surface. Entries are dropped once their surface is garbage collected.
+frame_buffers = weakref.WeakKeyDictionary()
+# Row bitmasks of each shape, rotation and column keyed by shape index.
+shape_masks = {}
+
 class Piece:
     """
     Represents a Tetris piece.
@@ -270,6 +292,8 @@ def game_loop(win: pygame.Surface)-> None:
     global grid
     # Dictionary representing locked positions in the current grid.
     locked = {}
+    # Empties the board array without reallocating it.
+    board.fill(0)
     
     # Creates a queue for upcoming pieces and sets the current piece.
     piece_queue = [get_shape() for x in range(5)]
@@ -354,7 +378,7 @@ def game_loop(win: pygame.Surface)-> None:
         if locked_piece:
             curr_piece = change_piece(curr_piece, shape_pos, 
                                       locked, piece_queue)
-            rows_cleared = clear_rows(grid, locked)
+            rows_cleared = clear_rows(grid, locked, board)
             
             # Awards points based on number of lines cleared
             if rows_cleared == 1:
@@ -587,9 +611,13 @@ def change_piece(curr_piece: Piece, shape_pos: list[tuple[int]],
         Piece: The new current Tetris piece.
     """
     # Locks each tile in the current piece to the grid.
+    colour_index = shapes.index(curr_piece.shape) + 1
     for pos in shape_pos:
         p = (pos[0], pos[1])
         locked[p] = curr_piece.colour
+        # Mirrors the tile onto the board array if it is inside the grid.
+        if pos[1] > -1:
+            board[pos[1], pos[0]] = colour_index
 
     # Moves onto the next piece and adds a new one to the queue.
     curr_piece = queue.pop(0)
@@ -598,13 +626,16 @@ def change_piece(curr_piece: Piece, shape_pos: list[tuple[int]],
     return curr_piece
 
 def clear_rows(grid: list[list[tuple[int]]], 
-               locked: dict[tuple[int], tuple[int]])-> int:
+               locked: dict[tuple[int], tuple[int]], 
+               cells: np.ndarray | None=None)-> int:
     """
     Clears lines that have been filled.
 
     Args:
         grid (list[list[tuple[int]]]): Representation of the current grid.
         locked (dict[tuple[int], tuple[int]]): Locked positions on the grid.
+        cells (np.ndarray | None): Board array to clear alongside locked, 
+        or None to leave it untouched.
     Returns:
         int: Number of lines cleared.
     """
@@ -631,9 +662,70 @@ def clear_rows(grid: list[list[tuple[int]]],
                     new_tile = locked[(col, row - 1)]
                     locked[(col, row)] = new_tile
                     del locked[col, row - 1]
+
+        # Shifts the board array down over the cleared line.
+        if cells is not None:
+            cells[1:line + 1] = cells[:line]
+            # Fills the top row with any tiles shifted in from above the grid.
+            for col in range(len(grid[0])):
+                tile = locked.get((col, 0))
+                cells[0, col] = shape_colours.index(tile) + 1 if tile else 0
         
     return len(lines_cleared)               
 
+def get_board()-> np.ndarray:
+    """
+    Returns a read-only view of the locked tiles on the board.
+
+    The view shares memory with the board, so it stays up to date as pieces 
+    lock and lines clear without being copied.
+
+    Returns:
+        np.ndarray: (20, 10) array of colour indices indexed by [row, col], 
+        where 0 is an empty tile and n is the colour of shapes[n - 1].
+    """
+    return board_view
+
+def get_frame(win: pygame.Surface, step: int=BLOCK_SIZE)-> np.ndarray:
+    """
+    Returns a downsampled frame of the pixels in the playable area.
+
+    Samples one pixel every step pixels, starting from the centre of the 
+    first tile. The samples are written into a buffer kept for each surface 
+    and step pair, so repeated calls with the same pair return the same 
+    array without allocating a new one. Copy the array to keep an 
+    observation past the next call. The buffers are freed along with their 
+    surface.
+
+    The surface is only locked while the samples are read, since pygame 
+    cannot blit to a surface while a view of its pixels is alive.
+
+    Args:
+        win (pygame.Surface): Pygame Surface object containing the 
+        display contents.
+        step (int): Distance in pixels between sampled pixels.
+    Returns:
+        np.ndarray: Array of RGB values indexed by [x, y, channel].
+    """
+    offset = step // 2
+    cols = slice(TL_X + offset, TL_X + PLAY_WIDTH, step)
+    rows = slice(TL_Y + offset, TL_Y + PLAY_HEIGHT, step)
+
+    buffers = frame_buffers.setdefault(win, {})
+    frame = buffers.get(step)
+    if frame is None:
+        width = len(range(cols.start, cols.stop, step))
+        height = len(range(rows.start, rows.stop, step))
+        frame = np.empty((width, height, 3), dtype=np.uint8)
+        buffers[step] = frame
+
+    # Copies the playable area out of the surface, unlocking it afterwards.
+    pixels = pygame.surfarray.pixels3d(win)
+    np.copyto(frame, pixels[cols, rows])
+    del pixels
+
+    return frame
+
 def check_lost(locked: dict[tuple[int], tuple[int]])-> bool:
     """
     Determines loss state of the game.
@@ -650,6 +742,336 @@ def check_lost(locked: dict[tuple[int], tuple[int]])-> bool:
             return True
     return False
 
+class TranspositionTable:
+    """
+    Bounded cache of board states searched by the lookahead solver. Evicts 
+    the least recently used entry once full.
+
+    Attributes:
+        max_size (int): Maximum number of entries kept.
+        entries (OrderedDict): Search results keyed by board state.
+        hits (int): Number of lookups that found an entry.
+        evictions (int): Number of entries evicted.
+    """
+    def __init__(self, max_size: int=TT_SIZE)-> None:
+        """
+        Initializes an empty transposition table.
+
+        Args:
+            max_size (int): Maximum number of entries kept.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.evictions = 0
+
+    def get(self, key: tuple)-> tuple | None:
+        """
+        Looks up a searched board state.
+
+        Args:
+            key (tuple): Key of the board state.
+        Returns:
+            tuple | None: The stored result, or None if it is not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            # Marks the entry as the most recently used.
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def put(self, key: tuple, value: tuple)-> None:
+        """
+        Stores the result of a searched board state.
+
+        Args:
+            key (tuple): Key of the board state.
+            value (tuple): Result of the search.
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        # Evicts the least recently used entry if the table is full.
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+def get_rows(locked: dict[tuple[int], tuple[int]])-> tuple[int]:
+    """
+    Converts locked positions to the compact board used by the solver.
+
+    Args:
+        locked (dict[tuple[int], tuple[int]]): Locked positions on the grid.
+    Returns:
+        tuple[int]: Bitmask of the locked tiles in each row, where bit n is 
+        set if column n is locked.
+    """
+    rows = [0] * Piece.rows
+    for col, row in locked:
+        if row > -1:
+            rows[row] |= 1 << col
+
+    return tuple(rows)
+
+def get_shape_masks(shape_index: int
+                    )-> list[tuple[int, int, list[tuple[int]]]]:
+    """
+    Returns the row bitmasks of a shape in every rotation and column that 
+    fits inside the grid, computing them on first use.
+
+    Args:
+        shape_index (int): Index of the shape in shapes.
+    Returns:
+        list[tuple[int, int, list[tuple[int]]]]: Rotation, column and the 
+        starting row and bitmask of each row of tiles.
+    """
+    if shape_index in shape_masks:
+        return shape_masks[shape_index]
+
+    masks = []
+    shape = shapes[shape_index]
+    for rotation in range(len(shape)):
+        # Tiles are offset by two columns from the piece position.
+        for col in range(-2, Piece.cols + 2):
+            piece = Piece(col, 0, shape)
+            piece.rotation = rotation
+            positions = convert_shape_format(piece)
+            if any(x < 0 or x >= Piece.cols for x, y in positions):
+                continue
+
+            # Groups the tiles into one bitmask per row.
+            rows = {}
+            for x, y in positions:
+                rows[y] = rows.get(y, 0) | 1 << x
+            masks.append((rotation, col, sorted(rows.items())))
+
+    shape_masks[shape_index] = masks
+    return masks
+
+def get_placements(shape_index: int, rows: tuple[int]
+                   )-> list[tuple[int, int, tuple[int], int]]:
+    """
+    Finds every position a shape can be hard dropped into without ending 
+    the game.
+
+    Args:
+        shape_index (int): Index of the shape in shapes.
+        rows (tuple[int]): Bitmask of the locked tiles in each row.
+    Returns:
+        list[tuple[int, int, tuple[int], int]]: Rotation, column, resulting 
+        rows and number of lines cleared for each placement.
+    """
+    placements = []
+
+    for rotation, col, masks in get_shape_masks(shape_index):
+        # Drops the piece until a tile would leave the grid or overlap a 
+        # locked tile. Rows above the grid are always empty.
+        drop = 0
+        while all(y + drop + 1 < Piece.rows and 
+                  (y + drop + 1 < 0 or not rows[y + drop + 1] & mask) 
+                  for y, mask in masks):
+            drop += 1
+
+        # Skips placements that would end the game. As in clear_rows, only 
+        # tiles in the row just above the grid can be shifted back into it.
+        if masks[0][0] + drop < -1:
+            continue
+
+        new_rows = list(rows)
+        above = 0
+        for y, mask in masks:
+            if y + drop < 0:
+                above |= mask
+            else:
+                new_rows[y + drop] |= mask
+
+        # Removes filled rows and adds empty rows above the rest.
+        kept = [row for row in new_rows if row != FULL_ROW]
+        lines = Piece.rows - len(kept)
+        if above and not lines:
+            continue
+        new_rows = [0] * lines + kept
+
+        # Moves tiles above the grid down into the top row that was freed.
+        if above:
+            new_rows[lines - 1] = above
+        placements.append((rotation, col, tuple(new_rows), lines))
+
+    return placements
+
+def max_points(pieces_left: int, rows: tuple[int])-> int:
+    """
+    Returns an upper bound on the points the remaining pieces can award.
+
+    Each cleared line needs its empty tiles filled by the 4 tiles of each 
+    piece, so at most the emptiest rows that fit within those tiles can be 
+    cleared. Clearing lines together is always worth at least as much as 
+    clearing them apart, so the lines are scored as tetrises and a remainder.
+
+    Args:
+        pieces_left (int): Number of pieces left to place.
+        rows (tuple[int]): Bitmask of the locked tiles in each row.
+    Returns:
+        int: Most points that could be awarded.
+    """
+    tiles = 4 * pieces_left
+    lines = 0
+    for empty in sorted(Piece.cols - row.bit_count() for row in rows):
+        if empty > tiles or lines == tiles:
+            break
+        tiles -= empty
+        lines += 1
+
+    return lines // 4 * TTS_PTS + LINE_PTS[lines % 4]
+
+def search_points(queue: tuple[int], rows: tuple[int], 
+                  table: TranspositionTable, floor: int | None=None
+                  )-> tuple[int, tuple[tuple[int]]] | None:
+    """
+    Searches for the placement sequence that awards the most points.
+
+    Args:
+        queue (tuple[int]): Indices in shapes of the pieces left to place.
+        rows (tuple[int]): Bitmask of the locked tiles in each row.
+        table (TranspositionTable): Cache of searched board states.
+        floor (int | None): Only sequences awarding more points than this 
+        are searched for, or None to search every sequence.
+    Returns:
+        tuple[int, tuple[tuple[int]]] | None: Points awarded and the rotation 
+        and column of each piece, or None if every sequence ends the game or 
+        awards no more than floor.
+    """
+    if not queue:
+        return 0, ()
+    if floor is not None and max_points(len(queue), rows) <= floor:
+        return None
+
+    # Reuses a stored result unless it was cut off by a higher floor.
+    key = ("points", rows, queue)
+    entry = table.get(key)
+    if entry is not None:
+        result, searched_floor = entry
+        if result is not None:
+            return result if floor is None or result[0] > floor else None
+        if searched_floor is None or (floor is not None and 
+                                      floor >= searched_floor):
+            return None
+
+    # Tries placements that clear the most lines first to raise the bound.
+    placements = get_placements(queue[0], rows)
+    placements.sort(key=lambda placement: placement[3], reverse=True)
+
+    best = None
+    for rotation, col, new_rows, lines in placements:
+        points = LINE_PTS[lines]
+        limit = best[0] if best is not None else floor
+
+        # Skips placements that cannot beat the best sequence found so far.
+        if limit is None:
+            result = search_points(queue[1:], new_rows, table)
+        elif points + max_points(len(queue) - 1, new_rows) <= limit:
+            continue
+        else:
+            result = search_points(queue[1:], new_rows, table, 
+                                   limit - points)
+
+        if result is not None and (best is None or 
+                                   points + result[0] > best[0]):
+            best = (points + result[0], ((rotation, col),) + result[1])
+
+    table.put(key, (best, floor))
+    return best
+
+def search_perfect_clear(queue: tuple[int], rows: tuple[int], 
+                         table: TranspositionTable
+                         )-> tuple[tuple[int]] | None:
+    """
+    Searches for a placement sequence that leaves the grid empty.
+
+    Args:
+        queue (tuple[int]): Indices in shapes of the pieces left to place.
+        rows (tuple[int]): Bitmask of the locked tiles in each row.
+        table (TranspositionTable): Cache of searched board states.
+    Returns:
+        tuple[tuple[int]] | None: Rotation and column of each piece, or None 
+        if no perfect clear is reachable.
+    """
+    # Each piece adds 4 tiles and each line removes 10, so the grid can only
+    # be emptied after enough pieces to fill every row that has tiles.
+    tiles = sum(row.bit_count() for row in rows)
+    used = sum(1 for row in rows if row)
+    if not any((tiles + 4 * k) % 10 == 0 and (tiles + 4 * k) // 10 >= used 
+               for k in range(1, len(queue) + 1)):
+        return None
+
+    key = ("perfect", rows, queue)
+    entry = table.get(key)
+    if entry is not None:
+        return entry[0]
+
+    result = None
+    for rotation, col, new_rows, _ in get_placements(queue[0], rows):
+        if not any(new_rows):
+            result = ((rotation, col),)
+            break
+        moves = search_perfect_clear(queue[1:], new_rows, table)
+        if moves is not None:
+            result = ((rotation, col),) + moves
+            break
+
+    table.put(key, (result,))
+    return result
+
+def find_best_moves(pieces: list[Piece], 
+                    locked: dict[tuple[int], tuple[int]], depth: int, 
+                    table: TranspositionTable | None=None
+                    )-> tuple[int, tuple[tuple[int]]] | None:
+    """
+    Finds the placement sequence that awards the most points over the next 
+    pieces.
+
+    Args:
+        pieces (list[Piece]): The current piece followed by the queue.
+        locked (dict[tuple[int], tuple[int]]): Locked positions on the grid.
+        depth (int): Number of pieces to search through.
+        table (TranspositionTable | None): Cache of searched board states, 
+        which can be shared between searches.
+    Returns:
+        tuple[int, tuple[tuple[int]]] | None: Points awarded and the rotation 
+        and column of each piece, or None if every sequence ends the game 
+        before all of the pieces are placed.
+    """
+    if table is None:
+        table = TranspositionTable()
+    queue = tuple(shapes.index(piece.shape) for piece in pieces[:depth])
+
+    return search_points(queue, get_rows(locked), table)
+
+def find_perfect_clear(pieces: list[Piece], 
+                       locked: dict[tuple[int], tuple[int]], depth: int, 
+                       table: TranspositionTable | None=None
+                       )-> tuple[tuple[int]] | None:
+    """
+    Finds a placement sequence that clears the whole grid within the next 
+    pieces.
+
+    Args:
+        pieces (list[Piece]): The current piece followed by the queue.
+        locked (dict[tuple[int], tuple[int]]): Locked positions on the grid.
+        depth (int): Maximum number of pieces to place.
+        table (TranspositionTable | None): Cache of searched board states, 
+        which can be shared between searches.
+    Returns:
+        tuple[tuple[int]] | None: Rotation and column of each piece, or None 
+        if no perfect clear is reachable.
+    """
+    if table is None:
+        table = TranspositionTable()
+    queue = tuple(shapes.index(piece.shape) for piece in pieces[:depth])
+
+    return search_perfect_clear(queue, get_rows(locked), table)
+
 def game_over(win: pygame.Surface, score: int)-> None:
     """
     Displays the game over screen.